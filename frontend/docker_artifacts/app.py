@@ -2,17 +2,42 @@ import os
 import gradio as gr
 import logging
 import sys
+import ssl
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from urllib3.util.retry import Retry
+import copy
+import hashlib
+import io
 import json
-import base64
+import orjson
+import mimetypes
+import re
+import pybase64
+import itertools
+import tempfile
+import wave
+import numpy as np
+import soundfile as sf
 import pymysql
-from datetime import datetime
+import threading
+from dbutils.pooled_db import PooledDB
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from types import MappingProxyType
+from datetime import date, datetime
 
 hpe_theme = gr.themes.Soft(
     primary_hue="emerald",
 )
 
+# Logo embedded in the page header, encoded once at import
+with open("logo.png", "rb") as f:
+    LOGO_DATA_URI = "data:image/png;base64," + pybase64.b64encode(f.read()).decode("ascii")
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -24,6 +49,128 @@ logger = logging.getLogger(__name__)
 # Disable SSL warnings for self-signed certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Single SSL context shared by all HTTPS connections, so it is built once rather than per
+# connection pool. Certificates are not verified (self-signed endpoints).
+SSL_CONTEXT = ssl.create_default_context()
+SSL_CONTEXT.check_hostname = False
+SSL_CONTEXT.verify_mode = ssl.CERT_NONE
+
+class SSLContextAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools all use SSL_CONTEXT"""
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = SSL_CONTEXT
+        return super().init_poolmanager(*args, **kwargs)
+
+# Gradio runs the (blocking) handlers on a worker thread pool. This is the only server-wide
+# cap - no more than MAX_THREADS handlers run at once, whatever the limits below add up to
+MAX_THREADS = int(os.getenv("GRADIO_MAX_THREADS", "64"))
+
+# Request queue limits. These are per event listener, not global: QUEUE_CONCURRENCY_LIMIT is
+# the default for each listener that sets no limit of its own, MODEL_CONCURRENCY_LIMIT caps
+# each model-calling listener separately so one busy model can't be flooded, and
+# MEDREASON_CONCURRENCY_LIMIT is shared by the listeners in the "medreason" group.
+# QUEUE_MAX_SIZE bounds how many events can wait in the queue in total.
+QUEUE_CONCURRENCY_LIMIT = int(os.getenv("QUEUE_CONCURRENCY_LIMIT", "32"))
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "256"))
+MODEL_CONCURRENCY_LIMIT = int(os.getenv("MODEL_CONCURRENCY_LIMIT", "5"))
+# TriageAI diagnoses share one group with a higher limit - vLLM batches concurrent requests
+# into the same forward passes, so sending them together keeps the GPU busy
+MEDREASON_CONCURRENCY_LIMIT = int(os.getenv("MEDREASON_CONCURRENCY_LIMIT", "16"))
+
+# Shared HTTP session so connections to the model endpoints are kept alive and reused.
+# The pool holds one connection per worker thread so busy periods don't churn sockets.
+# Both schemes are mounted since in-cluster model endpoints are often plain HTTP.
+SESSION = requests.Session()
+_ADAPTER_OPTIONS = {
+    "pool_connections": 8,
+    "pool_maxsize": MAX_THREADS,
+    "max_retries": Retry(total=2, backoff_factor=0.2)
+}
+SESSION.mount("https://", SSLContextAdapter(**_ADAPTER_OPTIONS))
+SESSION.mount("http://", HTTPAdapter(**_ADAPTER_OPTIONS))
+# Self-signed certificates are accepted for every request made through the session. Requests
+# also pass verify=False explicitly, since REQUESTS_CA_BUNDLE/CURL_CA_BUNDLE in the environment
+# override the session default whenever a request leaves verify unset
+SESSION.verify = False
+
+def _post(url, token, json_body, timeout, stream=False):
+    """POST a JSON payload to a model API using the shared session"""
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+    return SESSION.post(
+        url,
+        headers=headers,
+        data=orjson.dumps(json_body),
+        timeout=timeout,
+        stream=stream,
+        verify=False
+    )
+
+def _post_audio(url, token, audio, fields, timeout):
+    """POST an audio file path or in-memory FLAC buffer as a streamed multipart upload
+    using the shared session"""
+    if isinstance(audio, io.BytesIO):
+        return _post_multipart(url, token, ("recording.flac", audio, "audio/flac"), fields, timeout)
+    content_type = mimetypes.guess_type(audio)[0] or "application/octet-stream"
+    with open(audio, "rb") as audio_file:
+        return _post_multipart(url, token, (os.path.basename(audio), audio_file, content_type), fields, timeout)
+
+def _post_multipart(url, token, file_field, fields, timeout):
+    """POST a (filename, file object, content type) file field and form fields as multipart"""
+    # The encoder reads the file in small chunks while sending instead of loading it into memory
+    form = MultipartEncoder(fields={
+        "file": file_field,
+        **fields
+    })
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": form.content_type
+    }
+    return SESSION.post(
+        url,
+        headers=headers,
+        data=form,
+        timeout=timeout,
+        verify=False
+    )
+
+def iter_completion_text(response):
+    """Yield generated text as it arrives from a streamed (server-sent events) completion.
+    
+    Servers that ignore the stream flag and send a single JSON body are handled too. An error
+    reported part way through the stream raises RuntimeError."""
+    if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+        yield extract_response_text(_json(response))
+        return
+    for line in response.iter_lines():
+        if not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            break
+        event = orjson.loads(data)
+        # vLLM reports failures mid-stream as {"error": ...} or {"object": "error", ...}
+        if "error" in event or event.get("object") == "error":
+            error = event.get("error", event)
+            message = error.get("message", error) if isinstance(error, dict) else error
+            raise RuntimeError(f"MedReason stream error: {message}")
+        for choice in event.get("choices", ()):
+            text = choice.get("text")
+            if text is None:
+                text = choice.get("delta", {}).get("content")
+            if text:
+                yield text
+
+def _json(response):
+    """Decode a JSON response body with orjson"""
+    return orjson.loads(response.content)
+
+def _pretty_json(data):
+    """Format JSON data with 2-space indentation for display"""
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode("utf-8")
+
 # Default configurations
 DEFAULTS = {
     "medreason": {
@@ -51,14 +198,28 @@ DB_CONFIG = {
     'database': os.getenv('DB_NAME', '')
 }
 
+# MySQL connection pool, created on first use so the app still starts without a database
+_DB_POOL = None
+_DB_POOL_LOCK = threading.Lock()
+
+def get_db_pool():
+    """Return the shared MySQL connection pool"""
+    global _DB_POOL
+    with _DB_POOL_LOCK:
+        if _DB_POOL is None:
+            _DB_POOL = PooledDB(
+                creator=pymysql,
+                mincached=1,
+                maxcached=4,
+                maxconnections=8,
+                blocking=True,
+                **DB_CONFIG
+            )
+        return _DB_POOL
+
 def check_model(model_type, url, token):
     """Generic health check for model APIs"""
     try:
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
         # Different payload structures for different model types
         if model_type == "medreason":
             payload = {
@@ -81,13 +242,7 @@ def check_model(model_type, url, token):
             return check_medgemma_model(url, token)
         
         logger.info(f"Checking {model_type} at: {url}")
-        response = requests.post(
-            url, 
-            headers=headers, 
-            data=json.dumps(payload), 
-            verify=False,
-            timeout=10
-        )
+        response = _post(url, token, payload, timeout=10)
         
         # Different success conditions for different models
         if model_type == "whisper" and response.status_code == 400:
@@ -100,19 +255,48 @@ def check_model(model_type, url, token):
     except Exception as e:
         return False, f"{model_type.capitalize()} API error: {str(e)}"
 
-def encode_image_to_base64(image_path):
-    """Convert local image to base64 string"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+# Model APIs probed by each health check
+HEALTH_CHECK_MODELS = ("medreason", "whisper", "nllb", "medgemma")
+
+def run_all_health_checks(config):
+    """Check all model APIs concurrently and return results keyed by model type"""
+    checks = [
+        (model_type, config[model_type]["url"], config[model_type]["token"])
+        for model_type in HEALTH_CHECK_MODELS
+    ]
+    
+    # Each check waits on a different host, so run them side by side. The pool belongs to this
+    # call, so checks from concurrent users never wait behind each other
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix="health-check") as executor:
+        futures = {executor.submit(check_model, *args): args[0] for args in checks}
+        for future in as_completed(futures):
+            model_type = futures[future]
+            try:
+                results[model_type] = future.result()
+            except Exception as e:
+                # One failing check must not hide the results of the others
+                results[model_type] = (False, f"{model_type.capitalize()} API error: {str(e)}")
+    return results
+
+# Read size for streaming base64 - must be a multiple of 3 so chunks encode without padding.
+# The file is opened with a matching buffer so each chunk is a single read.
+BASE64_CHUNK_SIZE = 3 * 65536
+
+def iter_image_base64(image_path):
+    """Yield the base64 encoding of a local image chunk by chunk"""
+    with open(image_path, "rb", buffering=BASE64_CHUNK_SIZE) as image_file:
+        while True:
+            chunk = image_file.read(BASE64_CHUNK_SIZE)
+            if not chunk:
+                break
+            # Base64 output is plain ASCII bytes and goes into the request body as-is.
+            # pybase64 uses SIMD encoding where the CPU supports it
+            yield pybase64.b64encode(chunk)
 
 def check_medgemma_model(url, token):
     """Health check specifically for MedGemma model"""
     try:
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
         # Simple test payload for MedGemma
         payload = {
             "model": "google/medgemma-4b-it",
@@ -136,13 +320,7 @@ def check_medgemma_model(url, token):
         }
         
         logger.info(f"Checking MedGemma at: {url}/v1/chat/completions")
-        response = requests.post(
-            f"{url}/v1/chat/completions", 
-            headers=headers, 
-            data=json.dumps(payload), 
-            verify=False,
-            timeout=10
-        )
+        response = _post(f"{url}/v1/chat/completions", token, payload, timeout=10)
         
         if response.status_code == 200:
             return True, "MedGemma API is available and responding"
@@ -152,58 +330,101 @@ def check_medgemma_model(url, token):
     except Exception as e:
         return False, f"MedGemma API error: {str(e)}"
 
+# MedGemma X-ray request body, encoded once and split around the image placeholder
+# so the base64 image can be streamed in between without copying it into a payload
+_XRAY_PREFIX, _XRAY_SUFFIX = orjson.dumps({
+    "model": "google/medgemma-4b-it",
+    "messages": [
+        {
+            "role": "system",
+            "content": "You are an expert radiologist. Analyze the provided X-ray image and provide a detailed medical assessment."
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": "Please analyze this X-ray image. Describe any abnormalities, potential diagnoses, and recommendations for further evaluation if needed. Provide a structured analysis including: 1) Image quality assessment, 2) Anatomical structures visible, 3) Abnormal findings (if any), 4) Differential diagnoses, 5) Recommendations."
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": "data:image/png;base64,__IMAGE__"
+                    }
+                }
+            ]
+        }
+    ],
+    "max_tokens": 1000,
+    "temperature": 0.1
+}).split(b"__IMAGE__")
+
+# Caches of successful model results keyed by content hash, so repeating a request is instant.
+# Transcription, translation and X-ray analysis (temperature 0.1) give the same or nearly the
+# same result for the same input, endpoint and language. DIAGNOSE_CACHE is different - see below.
+CACHE_LOCK = threading.Lock()
+# (image digest, endpoint) -> X-ray analysis
+XRAY_CACHE = TTLCache(maxsize=256, ttl=3600)
+# (source language, target language, text digest, endpoint) -> translation
+TRANSLATION_CACHE = TTLCache(maxsize=4096, ttl=86400)
+# (audio digest, endpoint, language) -> Whisper result
+TRANSCRIPTION_CACHE = TTLCache(maxsize=512, ttl=3600)
+# (browser session, transcription digest, endpoint) -> (raw MedReason response, triage JSON).
+# MedReason samples at temperature 0.7, so this only absorbs double clicks and refreshes - it is
+# per user and short-lived so clicking Diagnose again a little later gives a fresh generation
+DIAGNOSE_CACHE_TTL = int(os.getenv("DIAGNOSE_CACHE_TTL", "120"))
+DIAGNOSE_CACHE = TTLCache(maxsize=512, ttl=DIAGNOSE_CACHE_TTL)
+
+def file_digest(path):
+    """Return a short BLAKE2b content hash of a file"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(BASE64_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def audio_digest(audio):
+    """Return a short BLAKE2b content hash of an audio file path or (sample_rate, samples) recording"""
+    if isinstance(audio, tuple):
+        sample_rate, samples = audio
+        digest = hashlib.blake2b(str(sample_rate).encode(), digest_size=16)
+        digest.update(np.ascontiguousarray(samples).tobytes())
+        return digest.hexdigest()
+    return file_digest(audio)
+
 def analyze_xray_with_medgemma(image_path, medgemma_url, medgemma_token):
     """Analyze X-ray image using MedGemma"""
     try:
-        # Convert image to base64
-        base64_image = encode_image_to_base64(image_path)
+        cache_key = (file_digest(image_path), medgemma_url)
+        with CACHE_LOCK:
+            cached = XRAY_CACHE.get(cache_key)
+        if cached is not None:
+            logger.info("Returning cached X-ray analysis")
+            return cached
+        
+        # Stream the base64 image straight into the request body instead of building it in memory
+        body = itertools.chain([_XRAY_PREFIX], iter_image_base64(image_path), [_XRAY_SUFFIX])
         
         headers = {
             "Authorization": f"Bearer {medgemma_token}",
             "Content-Type": "application/json"
         }
         
-        # Prepare the request payload
-        payload = {
-            "model": "google/medgemma-4b-it",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are an expert radiologist. Analyze the provided X-ray image and provide a detailed medical assessment."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Please analyze this X-ray image. Describe any abnormalities, potential diagnoses, and recommendations for further evaluation if needed. Provide a structured analysis including: 1) Image quality assessment, 2) Anatomical structures visible, 3) Abnormal findings (if any), 4) Differential diagnoses, 5) Recommendations."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "max_tokens": 1000,
-            "temperature": 0.1
-        }
-        
         logger.info(f"Sending X-ray analysis request to MedGemma")
-        response = requests.post(
+        response = SESSION.post(
             f"{medgemma_url}/v1/chat/completions",
             headers=headers,
-            data=json.dumps(payload),
-            verify=False,
-            timeout=120
+            data=body,
+            timeout=120,
+            verify=False
         )
         
         if response.status_code == 200:
-            result = response.json()
+            result = _json(response)
             if 'choices' in result and len(result['choices']) > 0:
                 analysis = result['choices'][0]['message']['content']
+                with CACHE_LOCK:
+                    XRAY_CACHE[cache_key] = analysis
                 return analysis
             else:
                 return f"Unexpected response format: {result}"
@@ -216,97 +437,103 @@ def analyze_xray_with_medgemma(image_path, medgemma_url, medgemma_token):
         return f"Error: {str(e)}"
 
 
-def save_diagnosis_to_db(json_data):
-    """Save diagnosis data to MySQL database"""
-    if not json_data or json_data == "No JSON found in response" or json_data == "Invalid JSON format":
-        return False, "No valid data to save to database."
-    
+# Note we're not including medical_reasoning as per requirements
+TRIAGE_INSERT_SQL = """
+INSERT INTO triage (
+    patient_name, date_of_birth, visit_time, severity, 
+    primary_diagnosis, secondary_diagnoses, recommended_tests, 
+    recommended_treatment, follow_up
+) VALUES (
+    %s, %s, %s, %s, %s, %s, %s, %s, %s
+)
+"""
+
+# Expected shapes of the date fields returned by MedReason
+_DATE_RE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+_DATETIME_RE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2}")
+
+def _is_calendar_value(parse, value):
+    """Check that a correctly shaped date string is a real date, e.g. not 1978-02-30"""
     try:
-        # Parse the JSON string
-        try:
-            diagnosis_data = json.loads(json_data)
-        except json.JSONDecodeError:
-            return False, "Failed to parse JSON data."
-        
-        # Connect to the database
-        connection = pymysql.connect(**DB_CONFIG)
-        cursor = connection.cursor()
-        
-        # Validate and clean data
-        patient_name = diagnosis_data.get("patient_name", "N/A")
-        
-        # Handle date_of_birth - ensure YYYY-MM-DD format
-        date_of_birth = diagnosis_data.get("date_of_birth", "N/A")
-        if date_of_birth == "N/A" or not date_of_birth:
-            date_of_birth = "N/A"
-        else:
-            try:
-                # Try to parse the date to validate format
-                datetime.strptime(date_of_birth, "%Y-%m-%d")
-            except ValueError:
-                date_of_birth = "N/A"
+        parse(value)
+        return True
+    except ValueError:
+        return False
+
+def _normalize_diagnosis(diagnosis_data):
+    """Validate and clean a diagnosis into a row for the triage table"""
+    patient_name = diagnosis_data.get("patient_name", "N/A")
+    
+    # Handle date_of_birth - ensure YYYY-MM-DD format
+    date_of_birth = diagnosis_data.get("date_of_birth", "N/A")
+    if date_of_birth == "N/A" or not date_of_birth:
+        date_of_birth = "N/A"
+    elif not _DATE_RE.fullmatch(date_of_birth) or not _is_calendar_value(date.fromisoformat, date_of_birth):
+        date_of_birth = "N/A"
+    
+    # Handle visit_time - ensure YYYY-MM-DD HH:MM:SS format
+    visit_time = diagnosis_data.get("visit_time", "N/A")
+    if visit_time == "N/A" or not visit_time:
+        visit_time = "N/A"
+    else:
+        # First, replace T with space if it's in ISO format
+        if "T" in visit_time:
+            visit_time = visit_time.replace("T", " ")
         
-        # Handle visit_time - ensure YYYY-MM-DD HH:MM:SS format
-        visit_time = diagnosis_data.get("visit_time", "N/A")
-        if visit_time == "N/A" or not visit_time:
+        # Check if this is just a date (YYYY-MM-DD) without time
+        if len(visit_time.strip()) == 10 and visit_time.count("-") == 2:
+            # Add a default time (00:00:00)
+            visit_time = f"{visit_time} 00:00:00"
+            
+        if not _DATETIME_RE.fullmatch(visit_time) or not _is_calendar_value(datetime.fromisoformat, visit_time):
             visit_time = "N/A"
-        else:
-            try:
-                # First, replace T with space if it's in ISO format
-                if "T" in visit_time:
-                    visit_time = visit_time.replace("T", " ")
-                
-                # Check if this is just a date (YYYY-MM-DD) without time
-                if len(visit_time.strip()) == 10 and visit_time.count("-") == 2:
-                    # Add a default time (00:00:00)
-                    visit_time = f"{visit_time} 00:00:00"
-                    
-                # Try to parse the date to validate format
-                datetime.strptime(visit_time, "%Y-%m-%d %H:%M:%S")
-            except ValueError:
-                visit_time = "N/A"
-        
-        # Get remaining fields with default value "N/A" if missing
-        severity = diagnosis_data.get("severity", "N/A")
-        primary_diagnosis = diagnosis_data.get("primary_diagnosis", "N/A")
-        secondary_diagnoses = diagnosis_data.get("secondary_diagnoses", "N/A")
-        recommended_tests = diagnosis_data.get("recommended_tests", "N/A")
-        recommended_treatment = diagnosis_data.get("recommended_treatment", "N/A")
-        follow_up = diagnosis_data.get("follow_up", "N/A")
-        
-        # Prepare SQL query - Note we're not including medical_reasoning as per requirements
-        sql = """
-        INSERT INTO triage (
-            patient_name, date_of_birth, visit_time, severity, 
-            primary_diagnosis, secondary_diagnoses, recommended_tests, 
-            recommended_treatment, follow_up
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s
-        )
-        """
+    
+    # Get remaining fields with default value "N/A" if missing, with special handling for dates
+    return (
+        patient_name,
+        None if date_of_birth == "N/A" else date_of_birth,
+        None if visit_time == "N/A" else visit_time,
+        diagnosis_data.get("severity", "N/A"),
+        diagnosis_data.get("primary_diagnosis", "N/A"),
+        diagnosis_data.get("secondary_diagnoses", "N/A"),
+        diagnosis_data.get("recommended_tests", "N/A"),
+        diagnosis_data.get("recommended_treatment", "N/A"),
+        diagnosis_data.get("follow_up", "N/A")
+    )
+
+def insert_diagnoses(diagnoses):
+    """Insert a list of diagnoses into the triage table, returns the first new record ID"""
+    connection = get_db_pool().connection()
+    try:
+        cursor = connection.cursor()
         
-        # Use special handling for dates
-        cursor.execute(sql, (
-            patient_name,
-            None if date_of_birth == "N/A" else date_of_birth,
-            None if visit_time == "N/A" else visit_time,
-            severity,
-            primary_diagnosis,
-            secondary_diagnoses,
-            recommended_tests,
-            recommended_treatment,
-            follow_up
-        ))
+        # PyMySQL rewrites executemany on an INSERT into a single multi-row statement
+        cursor.executemany(TRIAGE_INSERT_SQL, [_normalize_diagnosis(d) for d in diagnoses])
         
         # Commit the transaction
         connection.commit()
         
-        # Get the ID of the inserted record
+        # Get the ID of the (first) inserted record
         record_id = cursor.lastrowid
-        
-        # Close the connection
         cursor.close()
+        return record_id
+    finally:
+        # Return the connection to the pool
         connection.close()
+
+def save_diagnosis_to_db(json_data):
+    """Save diagnosis data to MySQL database"""
+    if not json_data or json_data == "No JSON found in response" or json_data == "Invalid JSON format":
+        return False, "No valid data to save to database."
+    
+    try:
+        # Parse the JSON string
+        try:
+            diagnosis_data = orjson.loads(json_data)
+        except json.JSONDecodeError:
+            return False, "Failed to parse JSON data."
+        
+        record_id = insert_diagnoses([diagnosis_data])
         
         return True, f"Diagnosis saved successfully to database with ID: {record_id}"
     
@@ -325,133 +552,259 @@ def save_diagnosis_to_db_button(json_data):
     success, message = save_diagnosis_to_db(json_data)
     return message
 
+# Supported languages and their ISO codes - all language lookups are derived from this
+ISO_LANGUAGE_CODES = MappingProxyType({
+    "English": "en",
+    "German": "de",
+    "Polish": "pl",
+    "Czech": "cs",
+    "Slovak": "sk",
+    "Ukrainian": "uk",
+    "Bulgarian": "bg",
+    "Finnish": "fi"
+})
+
+# Define the supported languages, interned so dropdown values compare cheaply
+LANGUAGES = tuple(sys.intern(name) for name in ISO_LANGUAGE_CODES)
+
+# Language name -> interned lower-case name, so equal languages share one object
+_LANG_CANON = MappingProxyType({name: sys.intern(name.lower()) for name in LANGUAGES})
+
+# Language name or ISO code -> NLLB language name
+_LANG_TO_NAME = MappingProxyType({
+    key: name.lower()
+    for name, code in ISO_LANGUAGE_CODES.items()
+    for key in (code, name.lower())
+})
+# Language name or ISO code -> display language name
+_ANY_TO_NORMALIZED = MappingProxyType({
+    key: name
+    for name, code in ISO_LANGUAGE_CODES.items()
+    for key in (code, name.lower())
+})
+
 def get_language_code(language_name):
     """Convert language name to code used by NLLB model"""
-    # Normalize language name to handle different formats from Whisper
-    normalized_name = language_name.lower() if language_name else "english"
-    
-    # Handle ISO codes that might be returned directly
-    if normalized_name in ["bg", "bulgarian"]:
-        return "bulgarian"
-    elif normalized_name in ["en", "english"]:
-        return "english"
-    elif normalized_name in ["de", "german"]:
-        return "german"
-    elif normalized_name in ["pl", "polish"]:
-        return "polish"
-    elif normalized_name in ["cs", "czech"]:
-        return "czech"
-    elif normalized_name in ["sk", "slovak"]:
-        return "slovak"
-    elif normalized_name in ["uk", "ukrainian"]:
-        return "ukrainian"
-    elif normalized_name in ["fi", "finnish"]:
-        return "finnish"
-    
-    # Default to English if no match
-    return "english"
+    # Normalize language name to handle different formats from Whisper,
+    # including ISO codes that might be returned directly. Default to English if no match
+    return _LANG_TO_NAME.get(language_name.lower() if language_name else "english", "english")
+
+def canonical_language(language_name):
+    """Return the interned lower-case form of a language name, comparable with `is`"""
+    return _LANG_CANON.get(language_name) or sys.intern(language_name.lower())
 
 def get_iso_language_code(language_name):
     """Convert language name to ISO code for Whisper API"""
-    iso_language_map = {
-        "English": "en",
-        "German": "de",
-        "Polish": "pl",
-        "Czech": "cs",
-        "Slovak": "sk",
-        "Ukrainian": "uk",
-        "Bulgarian": "bg",
-        "Finnish": "fi"
-    }
-    return iso_language_map.get(language_name, "en")
+    return ISO_LANGUAGE_CODES.get(language_name, "en")
 
 def normalize_language_name(language_code):
     """Convert various language codes/names to standard language names"""
-    code_map = {
-        "bg": "Bulgarian",
-        "en": "English",
-        "de": "German", 
-        "pl": "Polish",
-        "cs": "Czech",
-        "sk": "Slovak",
-        "uk": "Ukrainian",
-        "fi": "Finnish",
-        "bulgarian": "Bulgarian",
-        "english": "English",
-        "german": "German",
-        "polish": "Polish", 
-        "czech": "Czech",
-        "slovak": "Slovak",
-        "ukrainian": "Ukrainian",
-        "finnish": "Finnish"
-    }
+    return _ANY_TO_NORMALIZED.get(language_code.lower() if language_code else "en", "Unknown")
+
+# Silence trimming before Whisper upload - audio quieter than the threshold at the start and
+# end of a recording is cut, with a little padding kept so words aren't clipped
+SILENCE_THRESHOLD_DBFS = -40
+SILENCE_WINDOW_MS = 10
+SILENCE_PADDING_MS = 200
+MIN_SPEECH_MS = 200
+# Status shown when a recording is judged silent and is not sent to Whisper
+NO_SPEECH_MESSAGE = "No speech detected. Please try again with a clearer recording."
+# Larger recordings are uploaded as they are rather than loaded into memory
+SILENCE_TRIM_MAX_BYTES = 32 * 1024 * 1024
+# WAV audio bigger than this is re-encoded as lossless FLAC (about half the size) for upload
+FLAC_MIN_BYTES = 512 * 1024
+
+def _speech_bounds(samples, framerate, full_scale=32768):
+    """Return the (start, end) frames of a (frames, channels) sample array with leading and
+    trailing silence cut and padding kept, or None if it has no speech"""
+    # RMS level of each short window, over all channels
+    window = max(1, framerate * SILENCE_WINDOW_MS // 1000)
+    n_windows = len(samples) // window
+    if n_windows == 0:
+        return None
+    windows = samples[:n_windows * window].astype(np.float32).reshape(n_windows, -1)
+    rms = np.sqrt(np.mean(windows ** 2, axis=1))
+    voiced = np.flatnonzero(rms > full_scale * 10 ** (SILENCE_THRESHOLD_DBFS / 20))
+    
+    if voiced.size == 0 or (voiced[-1] - voiced[0] + 1) * SILENCE_WINDOW_MS < MIN_SPEECH_MS:
+        return None
+    
+    padding = framerate * SILENCE_PADDING_MS // 1000
+    return max(0, voiced[0] * window - padding), min(len(samples), (voiced[-1] + 1) * window + padding)
+
+def _encode_recording(recording):
+    """Trim a (sample_rate, samples) microphone recording and encode it as FLAC in memory.
+    
+    Returns a buffer ready for upload, or None if the recording has no speech."""
+    sample_rate, samples = recording
+    if samples.size == 0:
+        return None
+    samples = samples.reshape(len(samples), -1)
+    full_scale = np.iinfo(samples.dtype).max + 1 if samples.dtype.kind == "i" else 1.0
+    bounds = _speech_bounds(samples, sample_rate, full_scale)
+    if bounds is None:
+        return None
     
-    # Try to normalize the input
-    normalized = language_code.lower() if language_code else "en"
-    return code_map.get(normalized, "Unknown")
+    start, end = bounds
+    buffer = io.BytesIO()
+    sf.write(buffer, samples[start:end], sample_rate, format="FLAC")
+    buffer.seek(0)
+    logger.info(f"Encoded recording for upload: {len(samples)} -> {end - start} frames as FLAC")
+    return buffer
 
-def transcribe_audio(audio_path, auto_detect, expected_language, whisper_url, whisper_token):
-    """Transcribe audio using Whisper API"""
+def _prepare_audio(audio_path):
+    """Prepare a 16-bit PCM WAV for upload by trimming leading/trailing silence and
+    compressing it to FLAC if it is large.
+    
+    Returns the path to upload and whether it is a temporary file, or (None, False) if
+    the recording has no speech. Other formats are returned unchanged."""
+    if os.path.getsize(audio_path) > SILENCE_TRIM_MAX_BYTES:
+        return audio_path, False
     try:
-        headers = {
-            "Authorization": f"Bearer {whisper_token}"
-        }
-        
-        # Create form data with audio file - Fixed model reference
-        files = {
-            'file': open(audio_path, 'rb'),
-            'model': (None, 'openai/whisper-large-v3')  # Fixed model reference
+        with wave.open(audio_path, "rb") as wav:
+            params = wav.getparams()
+            frames = wav.readframes(params.nframes)
+    except (wave.Error, EOFError):
+        # Not a PCM WAV file - upload it as is
+        return audio_path, False
+    if params.sampwidth != 2 or params.nframes == 0:
+        return audio_path, False
+    
+    samples = np.frombuffer(frames, dtype="<i2").reshape(-1, params.nchannels)
+    bounds = _speech_bounds(samples, params.framerate)
+    if bounds is None:
+        return None, False
+    
+    start, end = bounds
+    compress = (end - start) * params.nchannels * params.sampwidth > FLAC_MIN_BYTES
+    if start == 0 and end == len(samples) and not compress:
+        return audio_path, False
+    
+    suffix = ".flac" if compress else ".wav"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        if compress:
+            sf.write(tmp, samples[start:end], params.framerate, format="FLAC", subtype="PCM_16")
+        else:
+            with wave.open(tmp, "wb") as trimmed:
+                trimmed.setparams(params)
+                trimmed.writeframes(samples[start:end].tobytes())
+    logger.info(f"Prepared audio for upload: {len(samples)} -> {end - start} frames as {suffix}")
+    return tmp.name, True
+
+@contextmanager
+def prepared_audio(audio):
+    """Context manager giving the audio to upload (or None if there is no speech).
+    
+    Uploaded files give a path; microphone recordings, passed as (sample_rate, samples),
+    give a FLAC buffer encoded in memory instead of another temporary file."""
+    if isinstance(audio, tuple):
+        yield _encode_recording(audio)
+        return
+    upload_path, is_temp = _prepare_audio(audio)
+    try:
+        yield upload_path
+    finally:
+        if is_temp:
+            os.remove(upload_path)
+
+def transcribe_audio(audio, auto_detect, expected_language, whisper_url, whisper_token):
+    """Transcribe an audio file path or (sample_rate, samples) recording using Whisper API.
+    
+    Returns (success, detected language, transcription) - on failure the last item is the error message,
+    which is NO_SPEECH_MESSAGE when the audio had no speech and was never uploaded."""
+    try:
+        # Create form data for the audio file - Fixed model reference
+        fields = {
+            'model': 'openai/whisper-large-v3'  # Fixed model reference
         }
         
         # Add language if not auto-detecting
         if not auto_detect:
             # Use ISO language code instead of full name
             iso_lang_code = get_iso_language_code(expected_language)
-            files['language'] = (None, iso_lang_code)
+            fields['language'] = iso_lang_code
             logger.info(f"Using specified language: {expected_language} (code: {iso_lang_code})")
         
-        # Request transcription
-        response = requests.post(
-            whisper_url,
-            headers=headers,
-            files=files,
-            verify=False,
-            timeout=300  # Increase timeout for longer audio files
-        )
+        cache_key = (audio_digest(audio), whisper_url, fields.get('language'))
+        with CACHE_LOCK:
+            result = TRANSCRIPTION_CACHE.get(cache_key)
         
-        if response.status_code == 200:
-            result = response.json()
-            transcription = result.get('text', '')
-            
-            # Get the detected language and normalize it
-            detected_language = result.get('language', 'Unknown')
-            logger.info(f"Raw detected language from Whisper: {detected_language}")
+        if result is None:
+            with prepared_audio(audio) as upload:
+                if upload is None:
+                    logger.info("No speech detected in audio")
+                    return False, "Unknown", NO_SPEECH_MESSAGE
+                
+                # Request transcription
+                response = _post_audio(
+                    whisper_url,
+                    whisper_token,
+                    upload,
+                    fields,
+                    timeout=300  # Increase timeout for longer audio files
+                )
             
-            # Normalize the language name for display
-            normalized_language = normalize_language_name(detected_language)
+            if response.status_code != 200:
+                logger.error(f"Whisper API error: {response.status_code}, {response.text}")
+                return False, "Unknown", f"Transcription failed: API returned status {response.status_code}, message: {response.text}"
             
-            return normalized_language, transcription
-        else:
-            logger.error(f"Whisper API error: {response.status_code}, {response.text}")
-            return "Unknown", f"Transcription failed: API returned status {response.status_code}, message: {response.text}"
+            result = _json(response)
+            with CACHE_LOCK:
+                TRANSCRIPTION_CACHE[cache_key] = result
+        
+        transcription = result.get('text', '')
+        
+        # Get the detected language and normalize it
+        detected_language = result.get('language', 'Unknown')
+        logger.info(f"Raw detected language from Whisper: {detected_language}")
+        
+        # Normalize the language name for display
+        normalized_language = normalize_language_name(detected_language)
+        
+        return True, normalized_language, transcription
             
     except Exception as e:
         logger.error(f"Error transcribing audio: {str(e)}")
-        return "Unknown", f"Error: {str(e)}"
-    finally:
-        # Close the file properly
-        try:
-            files['file'].close()
-        except:
-            pass
+        return False, "Unknown", f"Error: {str(e)}"
+
+def extract_translation(result):
+    """Extract just the translated text from an NLLB response"""
+    if "predictions" in result:
+        if isinstance(result["predictions"][0], dict) and "translated_text" in result["predictions"][0]:
+            return result["predictions"][0]["translated_text"]
+        else:
+            return result["predictions"][0]
+    elif "outputs" in result:
+        if isinstance(result["outputs"][0], dict) and "translated_text" in result["outputs"][0]:
+            return result["outputs"][0]["translated_text"]
+        else:
+            return result["outputs"][0]
+    else:
+        # Try to extract from any top-level field that seems to have the translation
+        for key, value in result.items():
+            if isinstance(value, list) and len(value) > 0:
+                if isinstance(value[0], str):
+                    return value[0]
+                elif isinstance(value[0], dict) and "translated_text" in value[0]:
+                    return value[0]["translated_text"]
+                elif isinstance(value[0], dict) and "translation" in value[0]:
+                    return value[0]["translation"]
+        
+        # If we got a direct dictionary response with translated_text
+        if isinstance(result, dict) and "translated_text" in result:
+            return result["translated_text"]
+        
+        return str(result)  # Return the whole result if we can't extract the translation
 
 def translate_text(text, source_lang, target_lang, nllb_url, nllb_token):
     """Translate text using NLLB API"""
     try:
-        headers = {
-            "Authorization": f"Bearer {nllb_token}",
-            "Content-Type": "application/json"
-        }
+        cache_key = (source_lang, target_lang, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest(), nllb_url)
+        with CACHE_LOCK:
+            cached = TRANSLATION_CACHE.get(cache_key)
+        if cached is not None:
+            logger.info(f"Returning cached translation from {source_lang} to {target_lang}")
+            return cached
         
         logger.info(f"Translating from {source_lang} to {target_lang}")
         
@@ -465,45 +818,16 @@ def translate_text(text, source_lang, target_lang, nllb_url, nllb_token):
             ]
         }
         
-        response = requests.post(
-            nllb_url, 
-            headers=headers, 
-            data=json.dumps(payload), 
-            verify=False,
-            timeout=300
-        )
+        response = _post(nllb_url, nllb_token, payload, timeout=300)
         
         if response.status_code == 200:
-            result = response.json()
+            result = _json(response)
             logger.info(f"Translation response format: {type(result)}")
             
-            # Extract just the translated text from the response
-            if "predictions" in result:
-                if isinstance(result["predictions"][0], dict) and "translated_text" in result["predictions"][0]:
-                    return result["predictions"][0]["translated_text"]
-                else:
-                    return result["predictions"][0]
-            elif "outputs" in result:
-                if isinstance(result["outputs"][0], dict) and "translated_text" in result["outputs"][0]:
-                    return result["outputs"][0]["translated_text"]
-                else:
-                    return result["outputs"][0]
-            else:
-                # Try to extract from any top-level field that seems to have the translation
-                for key, value in result.items():
-                    if isinstance(value, list) and len(value) > 0:
-                        if isinstance(value[0], str):
-                            return value[0]
-                        elif isinstance(value[0], dict) and "translated_text" in value[0]:
-                            return value[0]["translated_text"]
-                        elif isinstance(value[0], dict) and "translation" in value[0]:
-                            return value[0]["translation"]
-                
-                # If we got a direct dictionary response with translated_text
-                if isinstance(result, dict) and "translated_text" in result:
-                    return result["translated_text"]
-                
-                return str(result)  # Return the whole result if we can't extract the translation
+            translation = extract_translation(result)
+            with CACHE_LOCK:
+                TRANSLATION_CACHE[cache_key] = translation
+            return translation
         else:
             logger.error(f"NLLB API error: {response.status_code}, {response.text}")
             return f"Translation failed: API returned status {response.status_code}"
@@ -513,24 +837,146 @@ def translate_text(text, source_lang, target_lang, nllb_url, nllb_token):
         return f"Error: {str(e)}"
 
 
+# Static parts of the MedReason diagnosis prompt, built once
+_MEDREASON_PROMPT_PREFIX = "\n"
+_MEDREASON_PROMPT_SUFFIX = """
+
+Analyze the medical information above. After your analysis, provide your conclusion in valid JSON format with the following fields:
+{
+  "patient_name": "Full Name",
+  "date_of_birth": "MM/DD/YYYY",
+  "visit_time": "Date and Time",
+  "severity": "Mild/Moderate/Severe",
+  "primary_diagnosis": "Primary diagnosis",
+  "secondary_diagnoses": "Comma-separated list of secondary diagnoses or 'None'",
+  "recommended_tests": "Comma-separated list of recommended tests",
+  "recommended_treatment": "Treatment plan",
+  "follow_up": "Follow-up recommendations",
+  "medical_reasoning": "Brief summary of your medical reasoning"
+}
+
+Analyze the case carefully step by step. Include your thinking process and medical reasoning, following this structure:
+
+## Thinking
+Systematically explore possible diagnoses based on symptoms, findings, and medical history.
+
+### Reasoning Process
+Explain your diagnostic reasoning in detail, considering differential diagnoses and their likelihood.
+
+### Conclusion
+Summarize your findings and medical assessment.
+
+## Triage Summary
+Return your final answer in valid JSON format with all the fields mentioned above. Each field must contain a string value - no arrays allowed. Return ONLY valid JSON with no additional text.
+"""
+
+# Static parts of the TriageAI prompt, which asks for database-ready date formats
+_TRIAGE_PROMPT_PREFIX = "\n"
+_TRIAGE_PROMPT_SUFFIX = """
+
+Analyze the medical information above. After your analysis, provide your conclusion in valid JSON format with the following fields:
+{
+  "patient_name": "Full Name",
+  "date_of_birth": "YYYY-MM-DD",  // Format birth date as YYYY-MM-DD for database compatibility
+  "visit_time": "YYYY-MM-DD HH:MM:SS",  // Format visit time as YYYY-MM-DD HH:MM:SS for database compatibility
+  "severity": "Mild/Moderate/Severe",
+  "primary_diagnosis": "Primary diagnosis",
+  "secondary_diagnoses": "Comma-separated list of secondary diagnoses or 'None'",
+  "recommended_tests": "Comma-separated list of recommended tests",
+  "recommended_treatment": "Treatment plan",
+  "follow_up": "Follow-up recommendations",
+  "medical_reasoning": "Brief summary of your medical reasoning"
+}
+
+Analyze the case carefully step by step. Include your thinking process and medical reasoning, following this structure:
+
+## Thinking
+Systematically explore possible diagnoses based on symptoms, findings, and medical history.
+
+### Reasoning Process
+Explain your diagnostic reasoning in detail, considering differential diagnoses and their likelihood.
+
+### Conclusion
+Summarize your findings and medical assessment.
+
+## Triage Summary
+Return your final answer in valid JSON format with all the fields mentioned above. Each field must contain a string value - no arrays allowed.
+
+IMPORTANT: Format dates and times as follows:
+- date_of_birth: Use YYYY-MM-DD format (e.g., 1978-01-10)
+- visit_time: Use YYYY-MM-DD HH:MM:SS format (e.g., 2025-04-23 14:30:00)
+
+Return ONLY valid JSON with no additional text.
+"""
+
+# Number of streamed chunks between refreshes of the TriageAI output while generating
+STREAM_UPDATE_CHUNKS = 10
+
+# Fixed MedReason request fields for TriageAI, the prompt is added per request
+_TRIAGE_PAYLOAD = {
+    "model": "UCSC-VLAA/MedReason-8B",
+    "max_tokens": 4096,
+    "temperature": 0.7
+}
+
+# Shared decoder for pulling JSON objects out of free-form model output
+_JSON_DECODER = json.JSONDecoder()
+
+# Section headings MedReason uses to structure its answer
+_THINKING = "## Thinking"
+_REASONING = "### Reasoning Process"
+_CONCLUSION = "### Conclusion"
+_FINAL_ANSWER = "## Final Answer"
+_TRIAGE_SUMMARY = "## Triage Summary"
+_SECTION_RE = re.compile("|".join(
+    re.escape(marker) for marker in (_THINKING, _REASONING, _CONCLUSION, _FINAL_ANSWER, _TRIAGE_SUMMARY, "---")
+))
+
+# Response shapes returned by the different serving backends, tried in order
+_RESPONSE_EXTRACTORS = (
+    lambda r: r["choices"][0]["text"],
+    lambda r: r["choices"][0]["message"]["content"],
+    lambda r: _pretty_json(r["choices"][0]),
+    lambda r: r["response"],
+    lambda r: r["generations"][0]["text"],
+)
+
+def extract_response_text(result):
+    """Pull the generated text out of a completion response"""
+    for extract in _RESPONSE_EXTRACTORS:
+        try:
+            return extract(result)
+        except (KeyError, IndexError, TypeError):
+            continue
+    return _pretty_json(result)
+
+def extract_triage_json(raw_response):
+    """Pull the triage JSON that follows the summary heading out of a MedReason response"""
+    try:
+        # Look for JSON between curly braces that appears right after "## Triage Summary" or "## Final Answer"
+        _, marker, after_marker = raw_response.partition(_TRIAGE_SUMMARY)
+        if not marker:
+            _, marker, after_marker = raw_response.partition(_FINAL_ANSWER)
+        after_marker = after_marker.strip() if marker else raw_response
+
+        # Decode the first complete JSON object after the marker in one C-level pass
+        start = after_marker.find("{")
+        if start == -1:
+            return "No JSON found in response"
+        try:
+            json_data, _ = _JSON_DECODER.raw_decode(after_marker, start)
+        except json.JSONDecodeError:
+            return "Invalid JSON format"
+        # Format the JSON nicer
+        return _pretty_json(json_data)
+    except Exception as e:
+        logger.error(f"Error extracting JSON: {str(e)}")
+        return f"Error extracting JSON: {str(e)}"
+
 def parse_medreason_response(result):
     """Parse MedReason response into structured sections"""
-    response_text = ""
-    
     # Extract text from different possible response formats
-    if "choices" in result and len(result["choices"]) > 0:
-        if "text" in result["choices"][0]:
-            response_text = result["choices"][0]["text"]
-        elif "message" in result["choices"][0]:
-            response_text = result["choices"][0]["message"]["content"]
-        else:
-            response_text = json.dumps(result["choices"][0], indent=2)
-    elif "response" in result:
-        response_text = result["response"]
-    elif "generations" in result:
-        response_text = result["generations"][0]["text"]
-    else:
-        response_text = json.dumps(result, indent=2)
+    response_text = extract_response_text(result)
     
     # Extract sections from the response
     sections = {
@@ -540,54 +986,42 @@ def parse_medreason_response(result):
         "final_answer": ""
     }
     
-    # Check for ## Thinking section
-    if "## Thinking" in response_text:
-        thinking_section = response_text.split("## Thinking")[1]
-        if "## Final Answer" in thinking_section:
-            sections["thinking"] = thinking_section.split("## Final Answer")[0].strip()
-        elif "## Triage Summary" in thinking_section:
-            sections["thinking"] = thinking_section.split("## Triage Summary")[0].strip()
-        else:
-            sections["thinking"] = thinking_section.strip()
+    # Locate every section marker in a single pass over the response
+    occurrences = {}
+    for match in _SECTION_RE.finditer(response_text):
+        occurrences.setdefault(match.group(), []).append((match.start(), match.end()))
     
-    # Check for ### Reasoning Process section
-    if "### Reasoning Process" in response_text:
-        reasoning_section = response_text.split("### Reasoning Process")[1]
-        if "---" in reasoning_section:
-            sections["reasoning"] = reasoning_section.split("---")[0].strip()
-        elif "### Conclusion" in reasoning_section:
-            sections["reasoning"] = reasoning_section.split("### Conclusion")[0].strip()
-        else:
-            sections["reasoning"] = reasoning_section.strip()
+    def section(marker, stops=()):
+        """Text after the first marker, cut at the first stop marker (in priority order) before the marker repeats"""
+        if marker not in occurrences:
+            return ""
+        start = occurrences[marker][0][1]
+        limit = occurrences[marker][1][0] if len(occurrences[marker]) > 1 else len(response_text)
+        for stop in stops:
+            pos = next((pos for pos, _ in occurrences.get(stop, ()) if pos >= start), limit)
+            if pos < limit:
+                return response_text[start:pos].strip()
+        return response_text[start:limit].strip()
     
-    # Check for ### Conclusion section
-    if "### Conclusion" in response_text:
-        conclusion_section = response_text.split("### Conclusion")[1]
-        if "## Final Answer" in conclusion_section:
-            sections["conclusion"] = conclusion_section.split("## Final Answer")[0].strip()
-        elif "## Triage Summary" in conclusion_section:
-            sections["conclusion"] = conclusion_section.split("## Triage Summary")[0].strip()
-        else:
-            sections["conclusion"] = conclusion_section.strip()
+    sections["thinking"] = section(_THINKING, (_FINAL_ANSWER, _TRIAGE_SUMMARY))
+    sections["reasoning"] = section(_REASONING, ("---", _CONCLUSION))
+    sections["conclusion"] = section(_CONCLUSION, (_FINAL_ANSWER, _TRIAGE_SUMMARY))
     
     # Check for ## Final Answer or ## Triage Summary section
-    if "## Triage Summary" in response_text:
-        sections["final_answer"] = response_text.split("## Triage Summary")[1].strip()
-    elif "## Final Answer" in response_text:
-        sections["final_answer"] = response_text.split("## Final Answer")[1].strip()
+    if _TRIAGE_SUMMARY in occurrences:
+        sections["final_answer"] = section(_TRIAGE_SUMMARY)
+    elif _FINAL_ANSWER in occurrences:
+        sections["final_answer"] = section(_FINAL_ANSWER)
     
     # Try to extract JSON from the final answer
     try:
-        if "{" in sections["final_answer"] and "}" in sections["final_answer"]:
-            start = sections["final_answer"].find("{")
-            end = sections["final_answer"].rfind("}") + 1
-            json_str = sections["final_answer"][start:end]
-            
-            # Format the JSON nicer if possible
+        start = sections["final_answer"].find("{")
+        if start != -1:
+            # Decode the first complete JSON object, ignoring any trailing text
             try:
-                json_data = json.loads(json_str)
-                sections["final_answer"] = json.dumps(json_data, indent=2)
-            except:
+                json_data, _ = _JSON_DECODER.raw_decode(sections["final_answer"], start)
+                sections["final_answer"] = _pretty_json(json_data)
+            except json.JSONDecodeError:
                 # Keep the original if parsing fails
                 pass
     except Exception as e:
@@ -597,43 +1031,8 @@ def parse_medreason_response(result):
 def get_medreason_diagnosis(transcription, medreason_url, medreason_token):
     """Get diagnosis from MedReason using the transcribed notes"""
     try:
-        headers = {
-            "Authorization": f"Bearer {medreason_token}",
-            "Content-Type": "application/json"
-        }
-        
         # Create JSON prompt template with Triage Summary heading
-        json_prompt = f"""
-{transcription}
-
-Analyze the medical information above. After your analysis, provide your conclusion in valid JSON format with the following fields:
-{{
-  "patient_name": "Full Name",
-  "date_of_birth": "MM/DD/YYYY",
-  "visit_time": "Date and Time",
-  "severity": "Mild/Moderate/Severe",
-  "primary_diagnosis": "Primary diagnosis",
-  "secondary_diagnoses": "Comma-separated list of secondary diagnoses or 'None'",
-  "recommended_tests": "Comma-separated list of recommended tests",
-  "recommended_treatment": "Treatment plan",
-  "follow_up": "Follow-up recommendations",
-  "medical_reasoning": "Brief summary of your medical reasoning"
-}}
-
-Analyze the case carefully step by step. Include your thinking process and medical reasoning, following this structure:
-
-## Thinking
-Systematically explore possible diagnoses based on symptoms, findings, and medical history.
-
-### Reasoning Process
-Explain your diagnostic reasoning in detail, considering differential diagnoses and their likelihood.
-
-### Conclusion
-Summarize your findings and medical assessment.
-
-## Triage Summary
-Return your final answer in valid JSON format with all the fields mentioned above. Each field must contain a string value - no arrays allowed. Return ONLY valid JSON with no additional text.
-"""
+        json_prompt = _MEDREASON_PROMPT_PREFIX + transcription + _MEDREASON_PROMPT_SUFFIX
         
         # Create payload for the request
         payload = {
@@ -644,16 +1043,10 @@ Return your final answer in valid JSON format with all the fields mentioned abov
         }
         
         logger.info(f"Sending request to MedReason at: {medreason_url}")
-        response = requests.post(
-            medreason_url,
-            headers=headers,
-            data=json.dumps(payload),
-            verify=False,
-            timeout=60  # Longer timeout for MedReason responses
-        )
+        response = _post(medreason_url, medreason_token, payload, timeout=60)  # Longer timeout for MedReason responses
         
         if response.status_code == 200:
-            result = response.json()
+            result = _json(response)
             logger.info(f"Received successful response from MedReason")
             return parse_medreason_response(result)
         else:
@@ -676,9 +1069,12 @@ Return your final answer in valid JSON format with all the fields mentioned abov
 
 def save_config(config):
     """Save configuration to file"""
+    global CONFIG
     try:
         with open('api_config.json', 'w') as f:
             json.dump(config, f)
+        # Keep the cached configuration in step with the file
+        CONFIG = copy.deepcopy(config)
         return "Configuration saved successfully"
     except Exception as e:
         return f"Failed to save configuration: {str(e)}"
@@ -699,24 +1095,234 @@ def load_config():
         logger.error(f"Failed to load configuration: {str(e)}")
         return DEFAULTS
 
+# Configuration is read from disk once at import
+CONFIG = load_config()
+
+def get_config():
+    """Return a copy of the cached configuration"""
+    return copy.deepcopy(CONFIG)
+
+# Health Check tab functions
+def check_all_services(medreason_url, medreason_token, whisper_url, whisper_token, nllb_url, nllb_token, medgemma_url, medgemma_token):
+    """Check all services and return formatted status"""
+    results = []
+
+    # Check all models in parallel
+    checks = run_all_health_checks({
+        "medreason": {"url": medreason_url, "token": medreason_token},
+        "whisper": {"url": whisper_url, "token": whisper_token},
+        "nllb": {"url": nllb_url, "token": nllb_token},
+        "medgemma": {"url": medgemma_url, "token": medgemma_token}
+    })
+    medreason_ok, medreason_msg = checks["medreason"]
+    whisper_ok, whisper_msg = checks["whisper"]
+    nllb_ok, nllb_msg = checks["nllb"]
+    medgemma_ok, medgemma_msg = checks["medgemma"]
+
+    # Format results
+    status = lambda ok: "✅" if ok else "❌"
+    results.append(f"{status(medreason_ok)} MedReason LLM: {medreason_msg}")
+    results.append(f"{status(whisper_ok)} Whisper STT: {whisper_msg}")
+    results.append(f"{status(nllb_ok)} NLLB Translator: {nllb_msg}")
+    results.append(f"{status(medgemma_ok)} MedGemma Multimodal: {medgemma_msg}")
+
+    return "\n\n".join(results)
+
+def save_config_and_check(medreason_url, medreason_token, whisper_url, whisper_token, nllb_url, nllb_token, medgemma_url, medgemma_token):
+    """Save configuration and then check services"""
+    config = {
+        "medreason": {"url": medreason_url, "token": medreason_token},
+        "whisper": {"url": whisper_url, "token": whisper_token},
+        "nllb": {"url": nllb_url, "token": nllb_token},
+        "medgemma": {"url": medgemma_url, "token": medgemma_token}
+    }
+
+    save_msg = save_config(config)
+    check_msg = check_all_services(medreason_url, medreason_token, whisper_url, whisper_token, nllb_url, nllb_token, medgemma_url, medgemma_token)
+
+    return f"{check_msg}\n\n{save_msg}"
+
+
+def analyze_xray_image(image_path, medgemma_url, medgemma_token):
+    """Analyze uploaded X-ray image"""
+    if not image_path:
+        return "No image uploaded. Please upload an X-ray image first.", ""
+
+    try:
+        # Perform X-ray analysis with MedGemma
+        analysis = analyze_xray_with_medgemma(image_path, medgemma_url, medgemma_token)
+        return "Analysis complete.", analysis
+
+    except Exception as e:
+        logger.error(f"Error in analyze_xray_image: {str(e)}")
+        return f"Error: {str(e)}", ""
+
+# Patient Translation tab functions
+def toggle_audio_input(choice):
+    """Toggle between file upload and microphone recording"""
+    if choice == "Upload Audio File":
+        return gr.update(visible=True), gr.update(visible=False)
+    else:
+        return gr.update(visible=False), gr.update(visible=True)
+
+def transcribe_audio_only(audio_mode, audio_file, audio_recorder, patient_language, whisper_url, whisper_token):
+    """Process audio through Whisper for transcription in specified language"""
+    # Select the uploaded file path or the in-memory recording based on the mode
+    audio = audio_file if audio_mode == "Upload Audio File" else audio_recorder
+
+    if not audio:
+        return "", "No audio provided. Please upload or record audio first."
+
+    # Transcribe with Whisper using specified language
+    logger.info(f"Transcribing in {patient_language}")
+    success, _, transcription = transcribe_audio(audio, False, patient_language, whisper_url, whisper_token)
+
+    # Whisper errors, or NO_SPEECH_MESSAGE for a silent recording that was never uploaded
+    if not success:
+        return "", transcription
+
+    if not transcription or transcription.strip() == "":
+        return "", f"No transcription returned. Please try again with a clearer recording."
+
+    return transcription, f"Transcribed in {patient_language}."
+
+def translate_text_only(transcription, patient_language, doctor_language, nllb_url, nllb_token):
+    """Translate text using NLLB API"""
+    if not transcription.strip():
+        return "", "No text to translate. Please transcribe audio first."
+
+    try:
+        # Skip translation if source and target languages are the same
+        if canonical_language(doctor_language) is canonical_language(patient_language):
+            return transcription, f"Translation skipped (both languages are {patient_language})."
+
+        # Get language codes for both source and target
+        source_lang_code = get_language_code(patient_language)
+        target_lang_code = get_language_code(doctor_language)
+
+        logger.info(f"Translating from {patient_language} to {doctor_language}")
+
+        # Perform translation
+        translation = translate_text(
+            transcription, 
+            source_lang_code, 
+            target_lang_code,
+            nllb_url,
+            nllb_token
+        )
+
+        return translation, f"Translated from {patient_language} to {doctor_language}."
+
+    except Exception as e:
+        logger.error(f"Error in translate_text_only: {str(e)}")
+        return "", f"Error: {str(e)}"
+
+# TriageAI tab functions
+def _transcribe_doctor_audio(audio_mode, audio_file, audio_recorder, whisper_url, whisper_token):
+    """Transcribe doctor's audio notes, returns (success, transcription, status)"""
+    # Select the uploaded file path or the in-memory recording based on the mode
+    audio = audio_file if audio_mode == "Upload Audio File" else audio_recorder
+
+    if not audio:
+        return False, "", "No audio provided. Please upload or record audio first."
+
+    # Transcribe with Whisper
+    success, detected_lang, transcription = transcribe_audio(audio, False, "English", whisper_url, whisper_token)
+
+    # Whisper errors, or NO_SPEECH_MESSAGE for a silent recording that was never uploaded
+    if not success:
+        return False, "", transcription
+
+    if not transcription or transcription.strip() == "":
+        return False, "", "Failed to transcribe audio. Please try again with a clearer recording."
+
+    return True, transcription, "Transcription complete."
+
+def transcribe_doctor_notes(audio_mode, audio_file, audio_recorder, whisper_url, whisper_token):
+    """Transcribe doctor's audio notes"""
+    _, transcription, status = _transcribe_doctor_audio(audio_mode, audio_file, audio_recorder, whisper_url, whisper_token)
+    return transcription, status
+
+def diagnose_doctor_notes(transcription, medreason_url, medreason_token, request: gr.Request = None):
+    """Process doctor's notes through MedReason, streaming the response as it is generated"""
+    if not transcription or transcription.strip() == "":
+        yield "", "", "No transcription to analyze. Please transcribe audio first."
+        return
+
+    raw_response = ""
+    try:
+        # The same user resubmitting the same notes (a double click or a refresh) reuses the earlier diagnosis
+        session_hash = request.session_hash if request else None
+        cache_key = (session_hash, hashlib.blake2b(transcription.strip().encode("utf-8"), digest_size=16).digest(), medreason_url)
+        with CACHE_LOCK:
+            cached = DIAGNOSE_CACHE.get(cache_key)
+        if cached is not None:
+            logger.info("Returning cached MedReason diagnosis")
+            yield (*cached, "Analysis complete (cached).")
+            return
+
+        # Call MedReason API directly without using parse_medreason_response first
+        # Create JSON prompt template with Triage Summary heading with standardized date formats
+        json_prompt = _TRIAGE_PROMPT_PREFIX + transcription + _TRIAGE_PROMPT_SUFFIX
+
+        # Create payload for the request
+        payload = {**_TRIAGE_PAYLOAD, "prompt": json_prompt, "stream": True}
+
+        logger.info(f"Sending request to MedReason at: {medreason_url}")
+        # The timeout applies between received chunks, so long generations are not cut off
+        with _post(medreason_url, medreason_token, payload, timeout=60, stream=True) as response:
+            if response.status_code != 200:
+                logger.error(f"MedReason API error: {response.status_code}, {response.text}")
+                yield "", f"Error: MedReason API returned status code {response.status_code}", f"Error: API returned status {response.status_code}"
+                return
+
+            # Show the response while it is generated, refreshing every few chunks
+            for count, text in enumerate(iter_completion_text(response), 1):
+                raw_response += text
+                if count % STREAM_UPDATE_CHUNKS == 0:
+                    yield raw_response, "", "Generating..."
+        logger.info(f"Received successful response from MedReason")
+
+        json_output = extract_triage_json(raw_response)
+        # Only keep diagnoses with usable JSON so a bad generation can be retried
+        if json_output.startswith("{"):
+            with CACHE_LOCK:
+                DIAGNOSE_CACHE[cache_key] = (raw_response, json_output)
+        yield raw_response, json_output, "Analysis complete."
+
+    except Exception as e:
+        logger.error(f"Error in diagnose_doctor_notes: {str(e)}")
+        # Keep whatever was streamed before the failure on screen
+        yield raw_response, f"Error: {str(e)}", f"Error: {str(e)}"
+
+# Transcribe & Diagnose runs as two chained events, so the Whisper step doesn't hold one of
+# the MedReason slots. The first step passes on whether transcription succeeded.
+def transcribe_for_diagnosis(audio_mode, audio_file, audio_recorder, whisper_url, whisper_token):
+    """Transcribe doctor's notes and clear the previous diagnosis"""
+    yield "", "", "", "Transcribing...", False
+    success, transcription, status = _transcribe_doctor_audio(audio_mode, audio_file, audio_recorder, whisper_url, whisper_token)
+
+    if success:
+        # Show the transcription while MedReason is working
+        status = "Transcription complete. Analyzing with MedReason..."
+    yield transcription, "", "", status, success
+
+def diagnose_transcribed_notes(transcribed, transcription, medreason_url, medreason_token, request: gr.Request = None):
+    """Send freshly transcribed notes to MedReason, leaving the outputs alone if transcription failed"""
+    if not transcribed:
+        yield gr.update(), gr.update(), gr.update()
+        return
+    yield from diagnose_doctor_notes(transcription, medreason_url, medreason_token, request)
+
+
 def create_interface():
     """Create Gradio interface"""
-    config = load_config()
-    
-    # Define the supported languages
-    LANGUAGES = [
-        "English", "German", "Polish", "Czech", 
-        "Slovak", "Ukrainian", "Bulgarian", "Finnish"
-    ]
+    config = get_config()
     
     with gr.Blocks(theme=hpe_theme) as demo:
-        logo_path = "logo.png"
-        with open(logo_path, "rb") as f:
-            logo_data = base64.b64encode(f.read()).decode("utf-8")
-        
         gr.Markdown(f"""
         <div style="display: flex; align-items: center; gap: 10px">
-            <img src="data:image/png;base64,{logo_data}" alt="Triage AI Logo" 
+            <img src="{LOGO_DATA_URI}" alt="Triage AI Logo" 
                  style="max-height: 30px; max-width: 30x; width: auto; height: auto; object-fit: contain;" />
             <h1 style="margin: 0">HealthcareAI powered by HPE Private Cloud AI</h1>
         </div>
@@ -838,7 +1444,7 @@ def create_interface():
                         
                         with gr.Row(visible=False) as record_input_row:
                             audio_recorder = gr.Audio(
-                                type="filepath",
+                                type="numpy",
                                 label="Record Audio",
                                 sources=["microphone"],
                                 show_label=False
@@ -906,7 +1512,7 @@ def create_interface():
                         
                         with gr.Row(visible=False) as doctor_record_input_row:
                             doctor_audio_recorder = gr.Audio(
-                                type="filepath",
+                                type="numpy",
                                 label="Record Doctor's Notes",
                                 sources=["microphone"]
                             )
@@ -914,6 +1520,7 @@ def create_interface():
                         with gr.Row():
                             doctor_transcribe_btn = gr.Button("Transcribe", variant="primary")
                             doctor_diagnose_btn = gr.Button("Diagnose", variant="primary")
+                            doctor_pipeline_btn = gr.Button("Transcribe & Diagnose", variant="primary")
                     
                     with gr.Column():
                         gr.Markdown("### Transcription")
@@ -986,149 +1593,6 @@ def create_interface():
                             show_label=False
                         )
         
-        # Health Check tab functions
-        def check_all_services(medreason_url, medreason_token, whisper_url, whisper_token, nllb_url, nllb_token, medgemma_url, medgemma_token):
-            """Check all services and return formatted status"""
-            results = []
-            
-            # Check each model
-            medreason_ok, medreason_msg = check_model("medreason", medreason_url, medreason_token)
-            whisper_ok, whisper_msg = check_model("whisper", whisper_url, whisper_token)
-            nllb_ok, nllb_msg = check_model("nllb", nllb_url, nllb_token)
-            medgemma_ok, medgemma_msg = check_model("medgemma", medgemma_url, medgemma_token)
-            
-            # Format results
-            status = lambda ok: "✅" if ok else "❌"
-            results.append(f"{status(medreason_ok)} MedReason LLM: {medreason_msg}")
-            results.append(f"{status(whisper_ok)} Whisper STT: {whisper_msg}")
-            results.append(f"{status(nllb_ok)} NLLB Translator: {nllb_msg}")
-            results.append(f"{status(medgemma_ok)} MedGemma Multimodal: {medgemma_msg}")
-            
-            return "\n\n".join(results)
-        
-        def save_config_and_check(medreason_url, medreason_token, whisper_url, whisper_token, nllb_url, nllb_token, medgemma_url, medgemma_token):
-            """Save configuration and then check services"""
-            config = {
-                "medreason": {"url": medreason_url, "token": medreason_token},
-                "whisper": {"url": whisper_url, "token": whisper_token},
-                "nllb": {"url": nllb_url, "token": nllb_token},
-                "medgemma": {"url": medgemma_url, "token": medgemma_token}
-            }
-            
-            save_msg = save_config(config)
-            check_msg = check_all_services(medreason_url, medreason_token, whisper_url, whisper_token, nllb_url, nllb_token, medgemma_url, medgemma_token)
-            
-            return f"{check_msg}\n\n{save_msg}"
-
-
-        def analyze_xray_image(image_path, medgemma_url, medgemma_token):
-            """Analyze uploaded X-ray image"""
-            if not image_path:
-                return "No image uploaded. Please upload an X-ray image first.", ""
-            
-            try:
-                # Perform X-ray analysis with MedGemma
-                analysis = analyze_xray_with_medgemma(image_path, medgemma_url, medgemma_token)
-                return "Analysis complete.", analysis
-                    
-            except Exception as e:
-                logger.error(f"Error in analyze_xray_image: {str(e)}")
-                return f"Error: {str(e)}", ""
-                
-        # Patient Translation tab functions
-        def toggle_audio_input(choice):
-            """Toggle between file upload and microphone recording"""
-            if choice == "Upload Audio File":
-                return gr.update(visible=True), gr.update(visible=False)
-            else:
-                return gr.update(visible=False), gr.update(visible=True)
-        
-        def transcribe_audio_only(audio_mode, audio_file, audio_recorder, patient_language, whisper_url, whisper_token):
-            """Process audio through Whisper for transcription in specified language"""
-            # Select the appropriate audio path based on the mode
-            audio_path = audio_file if audio_mode == "Upload Audio File" else audio_recorder
-            
-            if not audio_path:
-                return "", "No audio provided. Please upload or record audio first."
-            
-            try:
-                # Transcribe with Whisper using specified language
-                iso_lang_code = get_iso_language_code(patient_language)
-                headers = {
-                    "Authorization": f"Bearer {whisper_token}"
-                }
-                
-                files = {
-                    'file': open(audio_path, 'rb'),
-                    'model': (None, 'openai/whisper-large-v3'),
-                    'language': (None, iso_lang_code)
-                }
-                
-                logger.info(f"Transcribing in {patient_language} (code: {iso_lang_code})")
-                
-                response = requests.post(
-                    whisper_url,
-                    headers=headers,
-                    files=files,
-                    verify=False,
-                    timeout=300
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    transcription = result.get('text', '')
-                    
-                    if not transcription or transcription.strip() == "":
-                        return "", f"No transcription returned. Please try again with a clearer recording."
-                    
-                    return transcription, f"Transcribed in {patient_language}."
-                        
-                else:
-                    logger.error(f"Whisper API error: {response.status_code}, {response.text}")
-                    return "", f"Transcription failed: API returned status {response.status_code}"
-                        
-            except Exception as e:
-                logger.error(f"Error in transcribe_audio_only: {str(e)}")
-                return "", f"Error: {str(e)}"
-            finally:
-                # Close the file properly
-                try:
-                    files['file'].close()
-                except:
-                    pass
-        
-        # Replace the translate_text_only function with:
-        def translate_text_only(transcription, patient_language, doctor_language, nllb_url, nllb_token):
-            """Translate text using NLLB API"""
-            if not transcription.strip():
-                return "", "No text to translate. Please transcribe audio first."
-            
-            try:
-                # Skip translation if source and target languages are the same
-                if doctor_language.lower() == patient_language.lower():
-                    return transcription, f"Translation skipped (both languages are {patient_language})."
-                
-                # Get language codes for both source and target
-                source_lang_code = get_language_code(patient_language)
-                target_lang_code = get_language_code(doctor_language)
-                
-                logger.info(f"Translating from {patient_language} to {doctor_language}")
-                
-                # Perform translation
-                translation = translate_text(
-                    transcription, 
-                    source_lang_code, 
-                    target_lang_code,
-                    nllb_url,
-                    nllb_token
-                )
-                
-                return translation, f"Translated from {patient_language} to {doctor_language}."
-                    
-            except Exception as e:
-                logger.error(f"Error in translate_text_only: {str(e)}")
-                return "", f"Error: {str(e)}"
-        
         # Connect Health Check tab buttons
         check_btn.click(
             fn=check_all_services,
@@ -1163,7 +1627,8 @@ def create_interface():
             outputs=[
                 transcription_output,
                 processing_status
-            ]
+            ],
+            concurrency_limit=MODEL_CONCURRENCY_LIMIT
         )
         
         translate_btn.click(
@@ -1178,7 +1643,8 @@ def create_interface():
             outputs=[
                 translation_output,
                 processing_status
-            ]
+            ],
+            concurrency_limit=MODEL_CONCURRENCY_LIMIT
         )
 
         # Connect XrayAI tab button
@@ -1192,7 +1658,8 @@ def create_interface():
             outputs=[
                 xray_status,
                 xray_analysis_output
-            ]
+            ],
+            concurrency_limit=MODEL_CONCURRENCY_LIMIT
         )
         
         # Toggle doctor audio input based on mode
@@ -1203,171 +1670,6 @@ def create_interface():
         )
         
         
-        def transcribe_doctor_notes(audio_mode, audio_file, audio_recorder, whisper_url, whisper_token):
-            """Transcribe doctor's audio notes"""
-            # Select the appropriate audio path based on the mode
-            audio_path = audio_file if audio_mode == "Upload Audio File" else audio_recorder
-            
-            if not audio_path:
-                return "", "No audio provided. Please upload or record audio first."
-            
-            try:
-                # Transcribe with Whisper
-                status_msg = "Transcribing..."
-                detected_lang, transcription = transcribe_audio(audio_path, False, "English", whisper_url, whisper_token)
-                
-                if not transcription or transcription.strip() == "":
-                    return "", "Failed to transcribe audio. Please try again with a clearer recording."
-                
-                return transcription, "Transcription complete."
-                    
-            except Exception as e:
-                logger.error(f"Error in transcribe_doctor_notes: {str(e)}")
-                return "", f"Error: {str(e)}"
-        
-        def diagnose_doctor_notes(transcription, medreason_url, medreason_token):
-            """Process doctor's notes through MedReason"""
-            if not transcription or transcription.strip() == "":
-                return "", "", "No transcription to analyze. Please transcribe audio first."
-            
-            try:
-                # Process with MedReason
-                status_msg = "Analyzing with MedReason..."
-                
-                # Call MedReason API directly without using parse_medreason_response first
-                headers = {
-                    "Authorization": f"Bearer {medreason_token}",
-                    "Content-Type": "application/json"
-                }
-                
-                # Create JSON prompt template with Triage Summary heading
-                # Create JSON prompt template with Triage Summary heading with standardized date formats
-                json_prompt = f"""
-                {transcription}
-                
-                Analyze the medical information above. After your analysis, provide your conclusion in valid JSON format with the following fields:
-                {{
-                  "patient_name": "Full Name",
-                  "date_of_birth": "YYYY-MM-DD",  // Format birth date as YYYY-MM-DD for database compatibility
-                  "visit_time": "YYYY-MM-DD HH:MM:SS",  // Format visit time as YYYY-MM-DD HH:MM:SS for database compatibility
-                  "severity": "Mild/Moderate/Severe",
-                  "primary_diagnosis": "Primary diagnosis",
-                  "secondary_diagnoses": "Comma-separated list of secondary diagnoses or 'None'",
-                  "recommended_tests": "Comma-separated list of recommended tests",
-                  "recommended_treatment": "Treatment plan",
-                  "follow_up": "Follow-up recommendations",
-                  "medical_reasoning": "Brief summary of your medical reasoning"
-                }}
-                
-                Analyze the case carefully step by step. Include your thinking process and medical reasoning, following this structure:
-                
-                ## Thinking
-                Systematically explore possible diagnoses based on symptoms, findings, and medical history.
-                
-                ### Reasoning Process
-                Explain your diagnostic reasoning in detail, considering differential diagnoses and their likelihood.
-                
-                ### Conclusion
-                Summarize your findings and medical assessment.
-                
-                ## Triage Summary
-                Return your final answer in valid JSON format with all the fields mentioned above. Each field must contain a string value - no arrays allowed.
-                
-                IMPORTANT: Format dates and times as follows:
-                - date_of_birth: Use YYYY-MM-DD format (e.g., 1978-01-10)
-                - visit_time: Use YYYY-MM-DD HH:MM:SS format (e.g., 2025-04-23 14:30:00)
-                
-                Return ONLY valid JSON with no additional text.
-                """
-                
-                # Create payload for the request
-                payload = {
-                    "model": "UCSC-VLAA/MedReason-8B",
-                    "prompt": json_prompt,
-                    "max_tokens": 4096,
-                    "temperature": 0.7
-                }
-                
-                logger.info(f"Sending request to MedReason at: {medreason_url}")
-                response = requests.post(
-                    medreason_url,
-                    headers=headers,
-                    data=json.dumps(payload),
-                    verify=False,
-                    timeout=60  # Longer timeout for MedReason responses
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info(f"Received successful response from MedReason")
-                    
-                    # Extract text from different possible response formats
-                    if "choices" in result and len(result["choices"]) > 0:
-                        if "text" in result["choices"][0]:
-                            raw_response = result["choices"][0]["text"]
-                        elif "message" in result["choices"][0]:
-                            raw_response = result["choices"][0]["message"]["content"]
-                        else:
-                            raw_response = json.dumps(result["choices"][0], indent=2)
-                    elif "response" in result:
-                        raw_response = result["response"]
-                    elif "generations" in result:
-                        raw_response = result["generations"][0]["text"]
-                    else:
-                        raw_response = json.dumps(result, indent=2)
-                    
-                    # Extract JSON from raw response - IMPROVED VERSION
-                    json_output = ""
-                    try:
-                        # Look for JSON between curly braces that appears right after "## Triage Summary" or "## Final Answer"
-                        if "## Triage Summary" in raw_response:
-                            after_marker = raw_response.split("## Triage Summary")[1].strip()
-                        elif "## Final Answer" in raw_response:
-                            after_marker = raw_response.split("## Final Answer")[1].strip()
-                        else:
-                            after_marker = raw_response
-                        
-                        # Find the first curly brace and the last curly brace
-                        if "{" in after_marker and "}" in after_marker:
-                            start = after_marker.find("{")
-                            # Find the last balanced closing brace
-                            open_count = 0
-                            end = -1
-                            for i, char in enumerate(after_marker[start:]):
-                                if char == '{':
-                                    open_count += 1
-                                elif char == '}':
-                                    open_count -= 1
-                                    if open_count == 0:
-                                        end = start + i + 1
-                                        break
-                            
-                            if end > start:
-                                json_str = after_marker[start:end]
-                                
-                                # Format the JSON nicer if possible
-                                try:
-                                    json_data = json.loads(json_str)
-                                    json_output = json.dumps(json_data, indent=2)
-                                except:
-                                    json_output = "Invalid JSON format"
-                            else:
-                                json_output = "No valid JSON found in response"
-                        else:
-                            json_output = "No JSON found in response"
-                    except Exception as e:
-                        logger.error(f"Error extracting JSON: {str(e)}")
-                        json_output = f"Error extracting JSON: {str(e)}"
-                    
-                    return raw_response, json_output, "Analysis complete."
-                else:
-                    logger.error(f"MedReason API error: {response.status_code}, {response.text}")
-                    return "", f"Error: MedReason API returned status code {response.status_code}", f"Error: API returned status {response.status_code}"
-                    
-            except Exception as e:
-                logger.error(f"Error in diagnose_doctor_notes: {str(e)}")
-                return "", f"Error: {str(e)}", f"Error: {str(e)}"
-        
         # Connect doctor diagnose button
 
         doctor_transcribe_btn.click(
@@ -1382,7 +1684,8 @@ def create_interface():
             outputs=[
                 doctor_transcription_output,
                 doctor_processing_status
-            ]
+            ],
+            concurrency_limit=MODEL_CONCURRENCY_LIMIT
         )
         
         doctor_diagnose_btn.click(
@@ -1396,7 +1699,46 @@ def create_interface():
                 doctor_raw_output,
                 doctor_json_output,
                 doctor_processing_status
-            ]
+            ],
+            concurrency_limit=MEDREASON_CONCURRENCY_LIMIT,
+            concurrency_id="medreason"
+        )
+
+        # Whether the Transcribe & Diagnose transcription step succeeded
+        doctor_transcribed = gr.State(False)
+
+        doctor_pipeline_btn.click(
+            fn=transcribe_for_diagnosis,
+            inputs=[
+                doctor_audio_mode,
+                doctor_audio_file,
+                doctor_audio_recorder,
+                whisper_url,
+                whisper_token
+            ],
+            outputs=[
+                doctor_transcription_output,
+                doctor_raw_output,
+                doctor_json_output,
+                doctor_processing_status,
+                doctor_transcribed
+            ],
+            concurrency_limit=MODEL_CONCURRENCY_LIMIT
+        ).then(
+            fn=diagnose_transcribed_notes,
+            inputs=[
+                doctor_transcribed,
+                doctor_transcription_output,
+                medreason_url,
+                medreason_token
+            ],
+            outputs=[
+                doctor_raw_output,
+                doctor_json_output,
+                doctor_processing_status
+            ],
+            concurrency_limit=MEDREASON_CONCURRENCY_LIMIT,
+            concurrency_id="medreason"
         )
 
         save_to_db_btn.click(
@@ -1410,5 +1752,6 @@ def create_interface():
 if __name__ == "__main__":
     logger.info("Creating Gradio interface")
     demo = create_interface()
+    demo.queue(default_concurrency_limit=QUEUE_CONCURRENCY_LIMIT, max_size=QUEUE_MAX_SIZE)
     logger.info("Launching Gradio server")
-    demo.launch(server_name="0.0.0.0", server_port=7860)
\ No newline at end of file
+    demo.launch(server_name="0.0.0.0", server_port=7860, max_threads=MAX_THREADS)
\ No newline at end of file